@@ -14,3 +14,4 @@ class LabTaskAdmin(admin.ModelAdmin):
     list_editable = ('topic',)
     search_fields = ('title', 'description')
     list_filter = ('topic', 'created_at')
+    readonly_fields = ('view_count', 'download_count', 'solution_download_count')
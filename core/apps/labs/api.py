@@ -1,12 +1,50 @@
 from ninja import NinjaAPI, File
-from ninja_jwt.authentication import JWTAuth
-from django.http import HttpResponse
+from ninja_jwt.authentication import JWTAuth, AsyncJWTAuth
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.core.files.uploadedfile import UploadedFile
+from django.utils.http import content_disposition_header
 from .models import Topic, LabTask
+from .schema import (
+    TopicSchema,
+    LabTaskSchema,
+    LabTaskFieldsSchema,
+    LabTaskBatchSchema,
+    CreateLabTaskSchema,
+    CatalogueManifestSchema,
+    ChangeFeedSchema,
+    ProfileSummarySchema,
+    PopularTaskSchema,
+    ArchiveMemberSchema,
+    SuggestionSchema,
+    parse_task_fields,
+    task_only_fields,
+    serialize_task,
+)
+from .snapshots import read_manifest, snapshot_rebuilder
+from .changelog import (
+    changes_since,
+    current_seq,
+    stream_changes,
+    MAX_CHANGES_PAGE,
+)
+from .profiling import list_profiles, load_profile, folded_stacks
+from .counters import hit_counter, VIEW, DOWNLOAD, SOLUTION_DOWNLOAD
+from .archives import (
+    ArchiveError,
+    archive_index,
+    find_member,
+    member_filename,
+    stream_member,
+)
+from .suggest import suggest_index
 from typing import List, Optional
-from ninja import Schema
 from django.db.models import Q
-from datetime import datetime
+
+# Максимум заданий в одном запросе GET /tasks?ids=...
+MAX_BATCH_TASKS = 100
 
 api = NinjaAPI(
     title="Labs API",
@@ -15,77 +53,209 @@ api = NinjaAPI(
 )
 
 
-class TopicSchema(Schema):
-    id: int
-    name: str
-    description: str
+def filter_tasks(queryset, q: str = None, topic_id: int = None):
+    # Общий фильтр поиска; его же проверяет audit_query_plans
+    if q:
+        queryset = queryset.filter(Q(title__icontains=q) | Q(description__icontains=q))
+    if topic_id:
+        queryset = queryset.filter(topic_id=topic_id)
+    return queryset
 
-    # Ninja использует методы resolve_* для вычисления полей схемы из объекта ORM
-    # В TopicSchema поля совпадают с ORM, resolve_* не требуются
 
+# Get all topics
+@api.get("/topics", response=List[TopicSchema], auth=JWTAuth())
+def get_topics(request):
+    return Topic.objects.all()
 
-class LabTaskSchema(Schema):
-    id: int
-    title: str
-    description: str
-    topic_id: int
-    file_url: Optional[str]
-    solution_file_url: Optional[str]
-    created_at: str  # Pydantic будет ожидать строку
 
-    @staticmethod
-    def resolve_file_url(obj: LabTask) -> Optional[str]:
-        # obj - это экземпляр LabTask
-        # Вычисляем file_url
-        return obj.file.url if obj.file else None
+def catalogue_not_built(request):
+    # Снимок собирает фоновый поток, а не обработчик запроса
+    snapshot_rebuilder.mark_dirty()
+    response = api.create_response(
+        request, {"error": "Catalogue snapshot is not built yet"}, status=503
+    )
+    response["Retry-After"] = str(
+        int(getattr(settings, "CATALOGUE_SNAPSHOT_DELAY", 2)) + 1
+    )
+    return response
+
+
+# Catalogue snapshot manifest (static files served by nginx/CDN)
+@api.get("/catalogue", response=CatalogueManifestSchema, auth=JWTAuth())
+def get_catalogue(request):
+    manifest = read_manifest()
+    if manifest is None:
+        return catalogue_not_built(request)
+    return manifest
+
+
+# Redirect to the current topics snapshot
+@api.get("/catalogue/topics", auth=JWTAuth())
+def get_catalogue_topics(request):
+    manifest = read_manifest()
+    if manifest is None:
+        return catalogue_not_built(request)
+    return HttpResponseRedirect(manifest["topics_url"])
+
+
+# Redirect to the current snapshot of tasks for a topic
+@api.get("/catalogue/topics/{topic_id}", auth=JWTAuth())
+def get_catalogue_topic_tasks(request, topic_id: int):
+    manifest = read_manifest()
+    if manifest is None:
+        return catalogue_not_built(request)
+    url = manifest["topic_urls"].get(topic_id)
+    if url is None:
+        return api.create_response(request, {"error": "Topic not found"}, status=404)
+    return HttpResponseRedirect(url)
+
+
+# Incremental change feed: everything after the given seq
+@api.get("/changes", response=ChangeFeedSchema, auth=JWTAuth())
+def get_changes(request, since: int = 0, limit: int = MAX_CHANGES_PAGE):
+    changes = changes_since(since, limit)
+    # head читаем после страницы, чтобы он был не меньше её последнего seq
+    head = current_seq()
+    return {
+        "changes": changes,
+        # since больше head (например, после очистки БД) не должен
+        # заставить клиента пропускать будущие записи
+        "next": changes[-1].id if changes else min(since, head),
+        "head": head,
+    }
+
+
+# Change feed as Server-Sent Events (ASGI only)
+@api.get("/changes/stream", auth=AsyncJWTAuth())
+async def stream_changes_sse(request, since: int = 0):
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный поток занял бы воркер целиком
+        return api.create_response(
+            request, {"error": "Streaming requires ASGI server"}, status=400
+        )
+    # Браузерный EventSource при переподключении присылает последний id
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id and last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+
+    response = StreamingHttpResponse(
+        stream_changes(
+            since,
+            poll_interval=getattr(settings, "CHANGES_POLL_INTERVAL", 1.0),
+            keepalive=getattr(settings, "CHANGES_KEEPALIVE", 15.0),
+            max_age=getattr(settings, "CHANGES_STREAM_MAX_AGE", 300.0),
+        ),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx не должен буферизовать поток
+    return response
 
-    @staticmethod
-    def resolve_solution_file_url(obj: LabTask) -> Optional[str]:
-        # obj - это экземпляр LabTask
-        # Вычисляем solution_file_url
-        return obj.solution_file.url if obj.solution_file else None
 
-    @staticmethod
-    def resolve_created_at(obj: LabTask) -> str:
-        # obj - это экземпляр LabTask
-        # Преобразуем datetime в строку
-        # Используем isoformat() для получения стандартной строки даты-времени
-        if isinstance(obj.created_at, datetime):
-            return obj.created_at.isoformat()
-        # Если уже строка, возвращаем как есть (на всякий случай)
-        return str(obj.created_at)
+# Autocomplete by task titles and topic names (in-memory prefix index)
+@api.get("/suggest", response=List[SuggestionSchema], auth=JWTAuth())
+def suggest(request, prefix: str = "", limit: int = 10):
+    return suggest_index.suggest(prefix, max(1, min(limit, 50)))
 
 
-class CreateLabTaskSchema(Schema):
-    title: str
-    description: str
-    topic_id: int
+# Search lab tasks by topic and/or query
+@api.get(
+    "/search",
+    response=List[LabTaskFieldsSchema],
+    auth=JWTAuth(),
+    exclude_unset=True,
+)
+def search_tasks(
+    request, q: str = None, topic_id: int = None, fields: Optional[str] = None
+):
+    # fields=id,title,topic_id - выбираем из БД и отдаём только эти поля
+    try:
+        names = parse_task_fields(fields)
+    except ValueError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
 
+    queryset = filter_tasks(
+        LabTask.objects.only(*task_only_fields(names)), q=q, topic_id=topic_id
+    )
+    return [serialize_task(task, names) for task in queryset]
 
-# Get all topics
-@api.get("/topics", response=List[TopicSchema], auth=JWTAuth())
-def get_topics(request):
-    return Topic.objects.all()
 
+# Fetch several tasks by id in one request
+@api.get(
+    "/tasks",
+    response=LabTaskBatchSchema,
+    auth=JWTAuth(),
+    exclude_unset=True,
+)
+def get_tasks_batch(request, ids: str, fields: Optional[str] = None):
+    # ids=3,1,2 - порядок ответа совпадает с порядком в запросе
+    try:
+        task_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        return api.create_response(request, {"error": "Invalid ids"}, status=400)
+    try:
+        names = parse_task_fields(fields)
+    except ValueError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+    if len(task_ids) > MAX_BATCH_TASKS:
+        return api.create_response(
+            request,
+            {"error": f"Too many ids, max {MAX_BATCH_TASKS}"},
+            status=400,
+        )
+
+    # Один запрос id IN (...), in_bulk возвращает словарь {id: task}
+    tasks = LabTask.objects.only(*task_only_fields(names)).in_bulk(task_ids)
+    return {
+        "items": [serialize_task(tasks[i], names) for i in task_ids if i in tasks],
+        "missing": [i for i in task_ids if i not in tasks],
+    }
 
-# Search lab tasks by topic and/or query
-@api.get("/search", response=List[LabTaskSchema], auth=JWTAuth())
-def search_tasks(request, q: str = None, topic_id: int = None):
-    queryset = LabTask.objects.all()
-    if q:
-        queryset = queryset.filter(Q(title__icontains=q) | Q(description__icontains=q))
-    if topic_id:
-        queryset = queryset.filter(topic_id=topic_id)
-    # Ninja теперь сможет использовать resolve_* методы для каждого объекта в queryset
-    return queryset
+
+# Most viewed / downloaded tasks
+POPULAR_ORDERING = {
+    "views": "-view_count",
+    "downloads": "-download_count",
+    "solution_downloads": "-solution_download_count",
+}
+
+
+@api.get("/popular", response=List[PopularTaskSchema], auth=JWTAuth())
+def get_popular_tasks(request, by: str = "views", limit: int = 10):
+    if by not in POPULAR_ORDERING:
+        return api.create_response(
+            request,
+            {"error": f"by must be one of: {', '.join(POPULAR_ORDERING)}"},
+            status=400,
+        )
+    limit = max(1, min(limit, 100))
+    # Сортировка по индексированному счётчику
+    return LabTask.objects.only(
+        "id",
+        "title",
+        "topic_id",
+        "view_count",
+        "download_count",
+        "solution_download_count",
+    ).order_by(POPULAR_ORDERING[by], "id")[:limit]
 
 
 # View task details
-@api.get("/tasks/{task_id}", response=LabTaskSchema, auth=JWTAuth())
-def get_task(request, task_id: int):
+@api.get(
+    "/tasks/{task_id}",
+    response=LabTaskFieldsSchema,
+    auth=JWTAuth(),
+    exclude_unset=True,
+)
+def get_task(request, task_id: int, fields: Optional[str] = None):
+    try:
+        names = parse_task_fields(fields)
+    except ValueError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+
     # Оборачиваем получение объекта в try-except
     try:
-        task = LabTask.objects.get(id=task_id)
+        task = LabTask.objects.only(*task_only_fields(names)).get(id=task_id)
     except LabTask.DoesNotExist:
         # Возвращаем 404 ошибку, если объект не найден
         # Используем api.create_response или просто raise Http404
@@ -95,8 +265,8 @@ def get_task(request, task_id: int):
         # Альтернативно, можно использовать:
         # return api.create_response(request, {"detail": "LabTask not found"}, status=404)
         # Но raise Http404 более идиоматично для Django и Ninja его корректно обработает.
-    # Ninja вызовет resolve_* методы для этого объекта
-    return task
+    hit_counter.hit(task.id, VIEW)
+    return serialize_task(task, names)
 
 
 # Download file
@@ -107,6 +277,7 @@ def download_file(request, task_id: int):
     except LabTask.DoesNotExist:
         return api.create_response(request, {"error": "File not found"}, status=404)
     if task.file:
+        hit_counter.hit(task.id, DOWNLOAD)
         response = HttpResponse(
             task.file.read(), content_type="application/octet-stream"
         )
@@ -117,6 +288,58 @@ def download_file(request, task_id: int):
     return api.create_response(request, {"error": "File not found"}, status=404)
 
 
+# List files inside the task zip archive
+@api.get(
+    "/tasks/{task_id}/archive",
+    response=List[ArchiveMemberSchema],
+    auth=JWTAuth(),
+)
+def list_archive(request, task_id: int):
+    try:
+        task = LabTask.objects.only("file").get(id=task_id)
+    except LabTask.DoesNotExist:
+        return api.create_response(request, {"error": "File not found"}, status=404)
+    if not task.file:
+        return api.create_response(request, {"error": "File not found"}, status=404)
+    try:
+        return archive_index(task.file)
+    except ArchiveError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+
+
+# Download a single file from the task zip archive
+@api.get("/tasks/{task_id}/archive/member", auth=JWTAuth())
+def download_archive_member(request, task_id: int, name: str):
+    try:
+        task = LabTask.objects.only("file").get(id=task_id)
+    except LabTask.DoesNotExist:
+        return api.create_response(request, {"error": "File not found"}, status=404)
+    if not task.file:
+        return api.create_response(request, {"error": "File not found"}, status=404)
+    try:
+        entry = find_member(task.file, name)
+    except ArchiveError as e:
+        return api.create_response(request, {"error": str(e)}, status=400)
+    if entry is None:
+        return api.create_response(
+            request, {"error": "File not found in archive"}, status=404
+        )
+    if entry["encrypted"]:
+        return api.create_response(
+            request, {"error": "Encrypted files are not supported"}, status=400
+        )
+
+    response = StreamingHttpResponse(
+        stream_member(task.file, entry), content_type="application/octet-stream"
+    )
+    response["Content-Length"] = entry["size"]
+    # Не-ASCII имена - через filename*, кавычки экранируются
+    response["Content-Disposition"] = content_disposition_header(
+        True, member_filename(entry["name"])
+    )
+    return response
+
+
 # Download solution file
 @api.get("/tasks/{task_id}/download-solution", auth=JWTAuth())
 def download_solution(request, task_id: int):
@@ -127,6 +350,7 @@ def download_solution(request, task_id: int):
             request, {"error": "Solution file not found"}, status=404
         )
     if task.solution_file:
+        hit_counter.hit(task.id, SOLUTION_DOWNLOAD)
         response = HttpResponse(
             task.solution_file.read(), content_type="application/octet-stream"
         )
@@ -148,11 +372,13 @@ def create_task(request, payload: CreateLabTaskSchema):
         )
 
     topic = Topic.objects.get(id=payload.topic_id)
-    task = LabTask.objects.create(
-        title=payload.title,
-        description=payload.description,
-        topic=topic,
-    )
+    # Запись в журнал изменений идёт в той же транзакции
+    with transaction.atomic():
+        task = LabTask.objects.create(
+            title=payload.title,
+            description=payload.description,
+            topic=topic,
+        )
     # Ninja вызовет resolve_* методы для этого объекта
     return task
 
@@ -178,7 +404,9 @@ def update_task(request, task_id: int, payload: CreateLabTaskSchema):
     task.title = payload.title
     task.description = payload.description
     task.topic = topic
-    task.save()
+    with transaction.atomic():
+        # Только изменённые поля: полный save() перезаписал бы счётчики, которые HitCounter обновляет в БД
+        task.save(update_fields=["title", "description", "topic"])
     # Ninja вызовет resolve_* методы для этого объекта
     return task
 
@@ -191,8 +419,50 @@ def delete_task(request, task_id: int):
             request, {"error": "Forbidden not admin"}, status=403
         )
 
+    # delete() сам выполняется в транзакции вместе с post_delete
     deleted, _ = LabTask.objects.filter(id=task_id).delete()
     if deleted == 0:
         # Задача не была найдена и удалена
         return api.create_response(request, {"error": "Task not found"}, status=404)
     return {"success": True}
+
+
+# Admin: list stored request profiles
+@api.get(
+    "/admin/profiles",
+    response=List[ProfileSummarySchema],
+    auth=JWTAuth(),
+    tags=["admin"],
+)
+def get_profiles(request):
+    if not request.auth.is_admin:
+        return api.create_response(
+            request, {"error": "Forbidden not admin"}, status=403
+        )
+    return list_profiles()
+
+
+# Admin: full profile with SQL timeline and sampled stacks
+@api.get("/admin/profiles/{profile_id}", auth=JWTAuth(), tags=["admin"])
+def get_profile(request, profile_id: str):
+    if not request.auth.is_admin:
+        return api.create_response(
+            request, {"error": "Forbidden not admin"}, status=403
+        )
+    profile = load_profile(profile_id)
+    if profile is None:
+        return api.create_response(request, {"error": "Profile not found"}, status=404)
+    return profile
+
+
+# Admin: collapsed stacks for flamegraph.pl / speedscope
+@api.get("/admin/profiles/{profile_id}/folded", auth=JWTAuth(), tags=["admin"])
+def get_profile_folded(request, profile_id: str):
+    if not request.auth.is_admin:
+        return api.create_response(
+            request, {"error": "Forbidden not admin"}, status=403
+        )
+    profile = load_profile(profile_id)
+    if profile is None:
+        return api.create_response(request, {"error": "Profile not found"}, status=404)
+    return HttpResponse(folded_stacks(profile), content_type="text/plain")
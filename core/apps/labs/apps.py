@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LabsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core.apps.labs"
+
+    def ready(self):
+        from . import signals  # noqa: F401
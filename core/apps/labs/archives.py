@@ -0,0 +1,129 @@
+"""
+Просмотр содержимого zip-архивов заданий без скачивания архива целиком.
+
+Индекс архива (центральный каталог zip) строится один раз для версии файла
+и кладётся в кэш Django по умолчанию. CACHES в проекте не настроен, так что
+это LocMemCache: кэш свой у каждого процесса, и каждый воркер gunicorn
+строит индекс заново при первом обращении к архиву. Для общего кэша
+достаточно настроить CACHES (Redis, Memcached, файловый). zipfile читает только конец файла через seek, архив в
+память не загружается. Отдельный файл из архива отдаётся потоком: по
+смещению из индекса читаем локальный заголовок и сразу сжатые данные.
+"""
+
+import hashlib
+import struct
+import zipfile
+import zlib
+
+from django.core.cache import cache
+from django.db.models.fields.files import FieldFile
+
+CHUNK_SIZE = 64 * 1024
+INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Локальный заголовок файла, см. zipfile.structFileHeader
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _cache_key(fieldfile: FieldFile) -> str:
+    # Новая загрузка файла меняет имя в хранилище (или хотя бы размер)
+    name = hashlib.sha1(fieldfile.name.encode("utf-8")).hexdigest()
+    return f"labs:zip-index:{name}:{fieldfile.size}"
+
+
+def _build_index(fieldfile: FieldFile) -> list[dict]:
+    with fieldfile.open("rb") as fh:
+        try:
+            with zipfile.ZipFile(fh) as zf:
+                infos = zf.infolist()
+        except zipfile.BadZipFile as e:
+            raise ArchiveError("File is not a zip archive") from e
+    return [
+        {
+            "name": info.filename,
+            "is_dir": info.is_dir(),
+            "size": info.file_size,
+            "compressed_size": info.compress_size,
+            "compress_type": info.compress_type,
+            "header_offset": info.header_offset,
+            "crc": info.CRC,
+            "encrypted": bool(info.flag_bits & 0x1),
+            "modified": "%04d-%02d-%02dT%02d:%02d:%02d" % info.date_time,
+        }
+        for info in infos
+    ]
+
+
+def archive_index(fieldfile: FieldFile) -> list[dict]:
+    key = _cache_key(fieldfile)
+    index = cache.get(key)
+    if index is None:
+        index = _build_index(fieldfile)
+        cache.set(key, index, INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def find_member(fieldfile: FieldFile, name: str) -> dict | None:
+    for entry in archive_index(fieldfile):
+        if entry["name"] == name and not entry["is_dir"]:
+            return entry
+    return None
+
+
+def member_filename(name: str) -> str:
+    """Имя файла из архива для Content-Disposition: без пути и управляющих символов."""
+    # Архивы из Windows иногда пишут пути через обратный слэш
+    basename = name.replace("\\", "/").rsplit("/", 1)[-1]
+    return "".join(ch for ch in basename if ch.isprintable()) or "file"
+
+
+def _read_compressed(fh, entry: dict):
+    fh.seek(entry["header_offset"])
+    header = fh.read(LOCAL_HEADER.size)
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise ArchiveError("Bad local file header")
+    # Имя и extra-поле в локальном заголовке могут отличаться от центрального каталога
+    fh.seek(fields[10] + fields[11], 1)
+
+    remaining = entry["compressed_size"]
+    while remaining > 0:
+        chunk = fh.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ArchiveError("Unexpected end of archive")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def stream_member(fieldfile: FieldFile, entry: dict):
+    """Генератор распакованного содержимого одного файла архива."""
+    with fieldfile.open("rb") as fh:
+        if entry["compress_type"] == zipfile.ZIP_STORED:
+            chunks = _read_compressed(fh, entry)
+        elif entry["compress_type"] == zipfile.ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            chunks = (
+                decompressor.decompress(chunk) for chunk in _read_compressed(fh, entry)
+            )
+        else:
+            # bzip2/lzma встречаются редко - отдаём через zipfile
+            zf = zipfile.ZipFile(fh)
+            member = zf.open(entry["name"])
+            chunks = iter(lambda: member.read(CHUNK_SIZE), b"")
+
+        crc = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if entry["compress_type"] == zipfile.ZIP_DEFLATED:
+            tail = decompressor.flush()
+            crc = zlib.crc32(tail, crc)
+            yield tail
+        if crc != entry["crc"]:
+            # Заголовки уже отправлены; обрываем поток, чтобы клиент увидел ошибку
+            raise ArchiveError(f"CRC mismatch for {entry['name']}")
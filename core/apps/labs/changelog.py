@@ -0,0 +1,93 @@
+"""
+Журнал изменений тем и заданий для инкрементальной синхронизации клиентов.
+
+Запись в журнал делается из сигналов моделей, то есть в той же транзакции,
+что и само изменение. Курсор - id записи (seq): клиент запоминает последний
+полученный seq и запрашивает /changes?since=<seq>.
+"""
+
+import asyncio
+import logging
+
+from django.db import connection, transaction
+
+from .models import ChangeLogEntry
+from .schema import ChangeSchema
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки PostgreSQL для записи в журнал
+CHANGELOG_LOCK_ID = 7202901
+
+# Максимальный размер одной страницы /changes
+MAX_CHANGES_PAGE = 1000
+
+
+def record_change(model_name: str, op: str, object_id: int):
+    if not connection.in_atomic_block:
+        # Сохранение вне atomic() (shell, скрипты) уже закоммичено
+        logger.warning(
+            "Change log entry for %s %s is written outside of the row's transaction",
+            model_name,
+            object_id,
+        )
+    # Без atomic() блокировка снялась бы сразу после своего SELECT,
+    # а INSERT закоммитился бы отдельно
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # id выдаётся при INSERT, а видимым становится при COMMIT. Без
+            # блокировки транзакция с меньшим seq может закоммититься позже, и
+            # клиент, уже получивший больший seq, её пропустит. Блокировка
+            # держится до конца транзакции и упорядочивает коммиты пишущих в журнал.
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CHANGELOG_LOCK_ID])
+        ChangeLogEntry.objects.create(model=model_name, op=op, object_id=object_id)
+
+
+def current_seq() -> int:
+    """Последний seq журнала; 0, если журнал пуст."""
+    return (
+        ChangeLogEntry.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    )
+
+
+def changes_since(since: int, limit: int = MAX_CHANGES_PAGE):
+    limit = max(1, min(limit, MAX_CHANGES_PAGE))
+    return list(ChangeLogEntry.objects.filter(id__gt=since).order_by("id")[:limit])
+
+
+async def stream_changes(
+    since: int, poll_interval: float, keepalive: float, max_age: float
+):
+    """Server-Sent Events: опрашивает журнал и отдаёт новые записи по мере появления.
+
+    Django 4.2 не замечает отключение клиента во время потоковой отдачи,
+    поэтому поток живёт не дольше max_age секунд. EventSource затем сам
+    переподключается с Last-Event-ID и продолжает с того же места.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_age
+    last_seq = since
+    idle = 0.0
+    # Через сколько миллисекунд EventSource переподключится после закрытия
+    yield f"retry: {int(poll_interval * 1000)}\n\n"
+    while loop.time() < deadline:
+        entries = [
+            entry
+            async for entry in ChangeLogEntry.objects.filter(id__gt=last_seq).order_by(
+                "id"
+            )[:MAX_CHANGES_PAGE]
+        ]
+        for entry in entries:
+            last_seq = entry.id
+            data = ChangeSchema.from_orm(entry).model_dump_json()
+            yield f"id: {entry.id}\nevent: change\ndata: {data}\n\n"
+        if entries:
+            idle = 0.0
+            continue
+        idle += poll_interval
+        if idle >= keepalive:
+            # Комментарий SSE, чтобы прокси не закрывали соединение
+            idle = 0.0
+            yield ": ping\n\n"
+        await asyncio.sleep(poll_interval)
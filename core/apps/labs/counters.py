@@ -0,0 +1,100 @@
+"""
+Счётчики просмотров и скачиваний заданий.
+
+Обработчики запросов только увеличивают счётчик в памяти процесса. Фоновый
+поток раз в COUNTERS_FLUSH_INTERVAL секунд (или раньше, если накопилось
+COUNTERS_FLUSH_THRESHOLD хитов) записывает их одним UPDATE на поле:
+
+    UPDATE labs_labtask SET view_count = view_count + CASE id WHEN ... END
+    WHERE id IN (...)
+
+При штатной остановке процесса остаток сбрасывается через atexit, при
+падении теряется не больше одного интервала.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+
+from .models import LabTask
+
+logger = logging.getLogger(__name__)
+
+VIEW = "view_count"
+DOWNLOAD = "download_count"
+SOLUTION_DOWNLOAD = "solution_download_count"
+
+
+class HitCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()  # (поле, id задания) -> число хитов
+        self._hits = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def hit(self, task_id: int, field: str):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Первый хит в процессе (в том числе после fork):
+                # поток мастера в воркер не переходит
+                self._start()
+            self._pending[(field, task_id)] += 1
+            self._hits += 1
+            if self._hits >= getattr(settings, "COUNTERS_FLUSH_THRESHOLD", 500):
+                self._wakeup.set()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._pending.clear()
+        self._hits = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, "COUNTERS_FLUSH_INTERVAL", 10)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self.flush()
+            # Соединение этого потока не держим открытым между сбросами
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._hits = 0
+        if not pending:
+            return
+
+        by_field = defaultdict(dict)
+        for (field, task_id), count in pending.items():
+            by_field[field][task_id] = count
+        for field, counts in by_field.items():
+            increment = Case(
+                *(When(id=task_id, then=Value(n)) for task_id, n in counts.items()),
+                default=Value(0),
+                output_field=PositiveBigIntegerField(),
+            )
+            try:
+                LabTask.objects.filter(id__in=counts).update(
+                    **{field: F(field) + increment}
+                )
+            except Exception:
+                logger.exception("Failed to flush %s counters", field)
+                # Вернём хиты, чтобы записать их в следующий раз
+                with self._lock:
+                    for task_id, n in counts.items():
+                        self._pending[(field, task_id)] += n
+                    self._hits += sum(counts.values())
+
+
+hit_counter = HitCounter()
+atexit.register(hit_counter.flush)
@@ -0,0 +1,252 @@
+import json
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from ninja_jwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+from core.apps.labs.api import filter_tasks
+from core.apps.labs.changelog import MAX_CHANGES_PAGE
+from core.apps.labs.models import Topic, LabTask, ChangeLogEntry
+
+User = get_user_model()
+
+
+# Запросы, для которых Seq Scan ожидаем: по умолчанию это предупреждение,
+# а не ошибка. С фильтром по теме (labs.search_q_topic) поиску по подстроке
+# хватает индекса topic_id
+EXPECTED_SEQSCAN = {
+    "labs.topics": "reads the whole table",
+    "labs.search_q": "icontains cannot use a B-tree index until a trigram "
+    "(pg_trgm) index exists",
+}
+
+
+class SeedRollback(Exception):
+    pass
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет EXPLAIN (ANALYZE, BUFFERS) для всех типовых запросов labs и "
+        "users API и завершается с ошибкой, если запросу не хватает индекса "
+        "(Seq Scan при enable_seqscan = off) или оценка числа строк слишком "
+        "велика. Ожидаемые Seq Scan (полный список тем, поиск по подстроке "
+        "без триграммного индекса) выводятся как предупреждения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed-tasks",
+            type=int,
+            default=0,
+            help="Сколько заданий создать перед проверкой (пользователей - в 20 "
+            "раз меньше), например 20000. По умолчанию используются текущие "
+            "данные. Созданные данные откатываются, но до конца проверки "
+            "держатся в одной транзакции - не запускайте на нагруженной базе.",
+        )
+        parser.add_argument(
+            "--max-rows",
+            type=int,
+            default=1000,
+            help="Максимальная оценка числа строк результата запроса",
+        )
+        parser.add_argument(
+            "--allow-seqscan",
+            action="append",
+            default=[],
+            metavar="QUERY",
+            help="Имя запроса, для которого Seq Scan допустим (можно повторять), "
+            "в дополнение к labs.topics и labs.search_q",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("audit_query_plans requires PostgreSQL")
+
+        failures, warnings = [], []
+        try:
+            with transaction.atomic():
+                if options["seed_tasks"]:
+                    self.seed(options["seed_tasks"])
+                # На маленьких таблицах Seq Scan дешевле любого индекса, и план
+                # зависел бы от объёма данных. С запретом Seq Scan остаётся
+                # только там, где подходящего индекса нет совсем
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                failures, warnings = self.audit(options)
+                # Тестовые данные не должны остаться в базе
+                raise SeedRollback
+        except SeedRollback:
+            pass
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} query plan problem(s):\n" + "\n".join(failures)
+            )
+        message = "All query plans OK"
+        if warnings:
+            message += f" ({len(warnings)} expected Seq Scan warning(s))"
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def seed(self, task_count: int):
+        # Уникальный суффикс: имена не пересекутся с уже существующими
+        run = uuid.uuid4().hex[:8]
+        topic_count = max(1, task_count // 400)
+        topics = Topic.objects.bulk_create(
+            Topic(name=f"Audit {run} topic {i}", description="Audit")
+            for i in range(topic_count)
+        )
+        LabTask.objects.bulk_create(
+            (
+                LabTask(
+                    title=f"Audit task {i}",
+                    description=f"Audit description {i} " * 10,
+                    topic=topics[i % topic_count],
+                    view_count=i % 997,
+                    download_count=i % 331,
+                )
+                for i in range(task_count)
+            ),
+            batch_size=1000,
+        )
+        ChangeLogEntry.objects.bulk_create(
+            (
+                ChangeLogEntry(model="labtask", op="create", object_id=i)
+                for i in range(task_count)
+            ),
+            batch_size=1000,
+        )
+
+        user_count = max(1, task_count // 20)
+        users = User.objects.bulk_create(
+            User(username=f"audit_{run}_{i}", email=f"audit_{run}_{i}@example.com")
+            for i in range(user_count)
+        )
+        expires_at = timezone.now() + timedelta(days=7)
+        tokens = OutstandingToken.objects.bulk_create(
+            (
+                OutstandingToken(
+                    user=user,
+                    jti=f"audit-{run}-{user.pk}",
+                    token="",
+                    expires_at=expires_at,
+                )
+                for user in users
+            ),
+            batch_size=1000,
+        )
+        BlacklistedToken.objects.bulk_create(
+            (BlacklistedToken(token=token) for token in tokens[::2]),
+            batch_size=1000,
+        )
+
+        # Свежая статистика, иначе планировщик оценивает таблицы как пустые
+        with connection.cursor() as cursor:
+            for model in (Topic, LabTask, ChangeLogEntry, User):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+            cursor.execute(f"ANALYZE {OutstandingToken._meta.db_table}")
+            cursor.execute(f"ANALYZE {BlacklistedToken._meta.db_table}")
+
+    def query_shapes(self):
+        task = LabTask.objects.order_by("id")[LabTask.objects.count() // 2]
+        user = User.objects.order_by("id").first()
+        token = OutstandingToken.objects.order_by("id").first()
+        last_seq = ChangeLogEntry.objects.order_by("-id").values_list("id", flat=True)
+        since = max((last_seq.first() or 0) - 100, 0)
+
+        shapes = {
+            "labs.topics": Topic.objects.all(),
+            "labs.search_q": filter_tasks(LabTask.objects.all(), q=task.title),
+            "labs.search_topic": filter_tasks(
+                LabTask.objects.all(), topic_id=task.topic_id
+            ),
+            "labs.search_q_topic": filter_tasks(
+                LabTask.objects.all(), q=task.title, topic_id=task.topic_id
+            ),
+            "labs.get_task": LabTask.objects.filter(id=task.id),
+            "labs.tasks_batch": LabTask.objects.filter(
+                id__in=[task.id, task.id + 1, task.id + 2]
+            ),
+            "labs.popular": LabTask.objects.order_by("-view_count", "id")[:10],
+            "labs.changes": ChangeLogEntry.objects.filter(id__gt=since).order_by("id")[
+                :MAX_CHANGES_PAGE
+            ],
+        }
+        if user is not None:
+            shapes["users.by_id"] = User.objects.filter(id=user.id)
+            shapes["users.by_username"] = User.objects.filter(username=user.username)
+        if token is not None:
+            shapes["tokens.outstanding_by_jti"] = OutstandingToken.objects.filter(
+                jti=token.jti
+            )
+            shapes["tokens.blacklisted_by_jti"] = BlacklistedToken.objects.filter(
+                token__jti=token.jti
+            )
+        return shapes
+
+    def audit(self, options) -> tuple[list[str], list[str]]:
+        if not LabTask.objects.exists():
+            raise CommandError("No tasks in database, use --seed-tasks")
+
+        failures = []
+        all_warnings = []
+        for name, queryset in self.query_shapes().items():
+            result = json.loads(
+                queryset.explain(format="json", analyze=True, buffers=True)
+            )[0]
+            plan = result["Plan"]
+            problems = []
+            warnings = []
+            for node in walk(plan):
+                # Любой Seq Scan, в том числе без Filter - под Sort для
+                # ORDER BY ... LIMIT или под Hash Join
+                if node["Node Type"] != "Seq Scan":
+                    continue
+                problem = f"Seq Scan on {node['Relation Name']}"
+                if "Filter" in node:
+                    problem += (
+                        f" (filter: {node['Filter']}, rows removed: "
+                        f"{node.get('Rows Removed by Filter', 0)})"
+                    )
+                if name in EXPECTED_SEQSCAN:
+                    warnings.append(f"{problem}: {EXPECTED_SEQSCAN[name]}")
+                elif name in options["allow_seqscan"]:
+                    warnings.append(f"{problem}: allowed by --allow-seqscan")
+                else:
+                    problems.append(problem)
+            if plan["Plan Rows"] > options["max_rows"]:
+                problems.append(
+                    f"estimated {plan['Plan Rows']} rows > {options['max_rows']}"
+                )
+
+            if problems:
+                status = self.style.ERROR("FAIL")
+            elif warnings:
+                status = self.style.WARNING("WARN")
+            else:
+                status = self.style.SUCCESS("ok")
+            self.stdout.write(
+                f"{status} {name}: {plan['Node Type']}, "
+                f"{result['Execution Time']:.2f} ms, "
+                f"shared hit/read {plan.get('Shared Hit Blocks', 0)}/"
+                f"{plan.get('Shared Read Blocks', 0)}"
+            )
+            for problem in problems:
+                self.stdout.write(f"    {problem}")
+            for warning in warnings:
+                self.stdout.write(f"    warning: {warning}")
+            if options["verbosity"] > 1:
+                self.stdout.write(json.dumps(result, indent=2))
+            failures.extend(f"{name}: {problem}" for problem in problems)
+            all_warnings.extend(f"{name}: {warning}" for warning in warnings)
+        return failures, all_warnings
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from core.apps.labs.snapshots import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Собирает статический снимок каталога тем и заданий в media/catalogue/"
+
+    def handle(self, *args, **options):
+        manifest = build_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Catalogue snapshot {manifest['version']}: "
+                f"{len(manifest['topic_urls'])} topics"
+            )
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-19 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("labs", "0003_changelogentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="labtask",
+            name="download_count",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="labtask",
+            name="solution_download_count",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name="labtask",
+            name="view_count",
+            field=models.PositiveBigIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -15,6 +15,38 @@ class LabTask(models.Model):
     file = models.FileField(upload_to='lab_files/', blank=True, null=True)
     solution_file = models.FileField(upload_to='solutions/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Обновляются пачками из counters.HitCounter, не через save()
+    # editable=False: формы админки не должны записывать старые значения
+    view_count = models.PositiveBigIntegerField(
+        default=0, db_index=True, editable=False
+    )
+    download_count = models.PositiveBigIntegerField(
+        default=0, db_index=True, editable=False
+    )
+    solution_download_count = models.PositiveBigIntegerField(
+        default=0, db_index=True, editable=False
+    )
 
     def __str__(self):
         return self.title
+
+
+class ChangeLogEntry(models.Model):
+    """Журнал изменений тем и заданий; id служит курсором синхронизации."""
+
+    OP_CREATE = 'create'
+    OP_UPDATE = 'update'
+    OP_DELETE = 'delete'
+    OP_CHOICES = [
+        (OP_CREATE, 'create'),
+        (OP_UPDATE, 'update'),
+        (OP_DELETE, 'delete'),
+    ]
+
+    model = models.CharField(max_length=20)
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.id}: {self.op} {self.model} {self.object_id}'
@@ -0,0 +1,193 @@
+"""
+Профилирование отдельных запросов в production.
+
+Запрос профилируется, если его прислал администратор с заголовком
+``X-Profile: 1`` или он попал в случайную выборку PROFILING_SAMPLE_RATE.
+Во время запроса фоновый поток раз в PROFILING_INTERVAL секунд снимает стек
+обрабатывающего потока (статистический профайлер), а execute_wrapper
+записывает SQL-запросы с их смещением от начала запроса. Стеки сохраняются
+в формате collapsed stacks ("a;b;c 12"), который понимают flamegraph.pl и
+speedscope. Профили лежат в PROFILING_DIR и доступны через
+/api/labs/admin/profiles.
+
+Для остальных запросов стоимость - проверка заголовка и random().
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_RE = re.compile(r"^\d+-\d+$")
+
+
+class StackSampler(threading.Thread):
+    """Периодически снимает стек указанного потока."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SqlTimeline:
+    """execute_wrapper: SQL-запросы со смещением от начала запроса."""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append(
+                {
+                    "start_ms": round((start - self.started) * 1000, 3),
+                    "duration_ms": round((end - start) * 1000, 3),
+                    "sql": sql[:2000],
+                }
+            )
+
+
+def _profiles_dir() -> Path:
+    return Path(getattr(settings, "PROFILING_DIR", settings.BASE_DIR / "profiles"))
+
+
+def save_profile(profile: dict):
+    directory = _profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{profile['id']}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(profile, ensure_ascii=False))
+    os.replace(tmp, path)
+
+    # Храним только последние PROFILING_KEEP профилей
+    keep = getattr(settings, "PROFILING_KEEP", 200)
+    files = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for old in files[:-keep]:
+        old.unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    directory = _profiles_dir()
+    if not directory.exists():
+        return []
+    result = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            profile = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        profile.pop("stacks", None)
+        profile["queries"] = len(profile.pop("sql", []))
+        result.append(profile)
+    return result
+
+
+def load_profile(profile_id: str) -> dict | None:
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    try:
+        return json.loads((_profiles_dir() / f"{profile_id}.json").read_text())
+    except FileNotFoundError:
+        return None
+
+
+def folded_stacks(profile: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+def _is_admin_request(request) -> bool:
+    from ninja_jwt.authentication import JWTAuth
+
+    header = request.headers.get("Authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        user = JWTAuth().authenticate(request, token)
+    except Exception:
+        return False
+    return bool(user and user.is_admin)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        self.interval = getattr(settings, "PROFILING_INTERVAL", 0.005)
+
+    def should_profile(self, request) -> bool:
+        if request.headers.get(PROFILE_HEADER):
+            # Проверяем токен только при наличии заголовка
+            return _is_admin_request(request)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        timeline = SqlTimeline(started)
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            with connection.execute_wrapper(timeline):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+
+        profile_id = f"{time.time_ns()}-{os.getpid()}"
+        save_profile(
+            {
+                "id": profile_id,
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "started_at": started_at.isoformat(),
+                "samples": sum(sampler.stacks.values()),
+                "interval_ms": self.interval * 1000,
+                "sql": timeline.queries,
+                "stacks": dict(sampler.stacks),
+            }
+        )
+        if request.headers.get(PROFILE_HEADER):
+            # Случайно выбранным запросам id не показываем: клиент не просил
+            # профиль и не должен узнавать, что его запрос профилировали
+            response["X-Profile-Id"] = profile_id
+        return response
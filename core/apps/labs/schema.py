@@ -0,0 +1,173 @@
+# core/apps/labs/schema.py
+
+from ninja import Schema
+from typing import List, Optional
+from datetime import datetime
+from .models import LabTask, ChangeLogEntry
+
+
+class TopicSchema(Schema):
+    id: int
+    name: str
+    description: str
+
+    # Ninja использует методы resolve_* для вычисления полей схемы из объекта ORM
+    # В TopicSchema поля совпадают с ORM, resolve_* не требуются
+
+
+class LabTaskSchema(Schema):
+    id: int
+    title: str
+    description: str
+    topic_id: int
+    file_url: Optional[str]
+    solution_file_url: Optional[str]
+    created_at: str  # Pydantic будет ожидать строку
+
+    @staticmethod
+    def resolve_file_url(obj: LabTask) -> Optional[str]:
+        # obj - это экземпляр LabTask
+        # Вычисляем file_url
+        return obj.file.url if obj.file else None
+
+    @staticmethod
+    def resolve_solution_file_url(obj: LabTask) -> Optional[str]:
+        # obj - это экземпляр LabTask
+        # Вычисляем solution_file_url
+        return obj.solution_file.url if obj.solution_file else None
+
+    @staticmethod
+    def resolve_created_at(obj: LabTask) -> str:
+        # obj - это экземпляр LabTask
+        # Преобразуем datetime в строку
+        # Используем isoformat() для получения стандартной строки даты-времени
+        if isinstance(obj.created_at, datetime):
+            return obj.created_at.isoformat()
+        # Если уже строка, возвращаем как есть (на всякий случай)
+        return str(obj.created_at)
+
+
+class LabTaskFieldsSchema(Schema):
+    # Ответ с ограниченным набором полей (?fields=...), отсутствующие поля не выводятся
+    id: Optional[int] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    topic_id: Optional[int] = None
+    file_url: Optional[str] = None
+    solution_file_url: Optional[str] = None
+    created_at: Optional[str] = None
+
+
+class LabTaskBatchSchema(Schema):
+    items: List[LabTaskFieldsSchema]
+    missing: List[int]
+
+
+# Поле ответа -> поле модели, которое нужно выбрать из БД
+LAB_TASK_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "topic_id": "topic_id",
+    "file_url": "file",
+    "solution_file_url": "solution_file",
+    "created_at": "created_at",
+}
+
+
+def parse_task_fields(fields: Optional[str]) -> list[str]:
+    """Разбирает параметр fields=a,b,c; без параметра возвращает все поля."""
+    if not fields:
+        return list(LAB_TASK_FIELDS)
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not names:
+        # fields=, или пробелы: иначе ответ был бы списком пустых объектов
+        raise ValueError("No fields given")
+    unknown = [name for name in names if name not in LAB_TASK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def task_only_fields(names: list[str]) -> list[str]:
+    """Поля модели для QuerySet.only()."""
+    return [LAB_TASK_FIELDS[name] for name in names]
+
+
+def serialize_task(task: LabTask, names: list[str]) -> dict:
+    # resolve_* вызываются только для запрошенных полей
+    data = {}
+    for name in names:
+        resolver = getattr(LabTaskSchema, f"resolve_{name}", None)
+        data[name] = resolver(task) if resolver else getattr(task, name)
+    return data
+
+
+class PopularTaskSchema(Schema):
+    id: int
+    title: str
+    topic_id: int
+    view_count: int
+    download_count: int
+    solution_download_count: int
+
+
+class ArchiveMemberSchema(Schema):
+    name: str
+    is_dir: bool
+    size: int
+    compressed_size: int
+    modified: str
+
+
+class SuggestionSchema(Schema):
+    kind: str  # "task" или "topic"
+    id: int
+    label: str
+
+
+class CreateLabTaskSchema(Schema):
+    title: str
+    description: str
+    topic_id: int
+
+
+class ChangeSchema(Schema):
+    seq: int
+    model: str
+    op: str
+    object_id: int
+    created_at: str
+
+    @staticmethod
+    def resolve_seq(obj: ChangeLogEntry) -> int:
+        return obj.id
+
+    @staticmethod
+    def resolve_created_at(obj: ChangeLogEntry) -> str:
+        return obj.created_at.isoformat()
+
+
+class ChangeFeedSchema(Schema):
+    changes: List[ChangeSchema]
+    next: int  # передать как since в следующем запросе
+    head: int  # последний seq журнала на момент ответа
+
+
+class ProfileSummarySchema(Schema):
+    id: str
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    started_at: str
+    samples: int
+    queries: int
+
+
+class CatalogueManifestSchema(Schema):
+    version: str
+    generated_at: str
+    topics_url: str
+    topic_urls: dict[int, str]
+    seq: int = 0  # seq журнала изменений, с которого продолжать /changes
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Topic, LabTask, ChangeLogEntry
+from .snapshots import schedule_snapshot_rebuild
+from .changelog import record_change
+from .suggest import schedule_index_update, TOPIC, TASK
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_save, sender=LabTask)
+def log_saved(sender, instance, created, **kwargs):
+    op = ChangeLogEntry.OP_CREATE if created else ChangeLogEntry.OP_UPDATE
+    record_change(sender._meta.model_name, op, instance.pk)
+
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=LabTask)
+def log_deleted(sender, instance, **kwargs):
+    # При удалении темы Django шлёт post_delete и для каждого её задания
+    record_change(sender._meta.model_name, ChangeLogEntry.OP_DELETE, instance.pk)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=LabTask)
+@receiver(post_delete, sender=LabTask)
+def catalogue_changed(sender, **kwargs):
+    # Любое изменение тем или заданий делает снимок каталога устаревшим
+    schedule_snapshot_rebuild()
+
+
+@receiver(post_save, sender=Topic)
+def suggest_topic_saved(sender, instance, **kwargs):
+    schedule_index_update(TOPIC, instance.pk, instance.name)
+
+
+@receiver(post_save, sender=LabTask)
+def suggest_task_saved(sender, instance, **kwargs):
+    schedule_index_update(TASK, instance.pk, instance.title)
+
+
+@receiver(post_delete, sender=Topic)
+@receiver(post_delete, sender=LabTask)
+def suggest_deleted(sender, instance, **kwargs):
+    kind = TOPIC if sender is Topic else TASK
+    schedule_index_update(kind, instance.pk, None)
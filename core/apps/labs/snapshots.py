@@ -0,0 +1,244 @@
+"""
+Статические снимки каталога (темы и задания по темам) для отдачи через nginx/CDN.
+
+Снимок пишется в хранилище media в каталог ``catalogue/<version>/``, где
+version - хэш содержимого, поэтому файлы неизменяемы и кэшируются навсегда.
+Рядом с каждым ``.json`` лежит ``.json.gz`` (для ``gzip_static on``).
+Единственный изменяемый файл - ``catalogue/manifest.json``, он указывает
+на текущую версию и должен кэшироваться коротко.
+
+Снимок пересобирается фоновым потоком процесса: коммит с изменениями тем или
+заданий только помечает снимок устаревшим, а поток собирает его через
+CATALOGUE_SNAPSHOT_DELAY секунд, объединяя все изменения за это время.
+Первый снимок собирает команда build_catalogue_snapshot (или первый запрос
+к /catalogue, который только будит поток).
+"""
+
+import atexit
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+
+from .models import Topic, LabTask
+from .schema import TopicSchema, LabTaskSchema
+from .changelog import current_seq
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = "catalogue"
+MANIFEST_NAME = f"{SNAPSHOT_DIR}/manifest.json"
+
+
+def _dump(payload) -> bytes:
+    return json.dumps(
+        payload, ensure_ascii=False, separators=(",", ":"), cls=DjangoJSONEncoder
+    ).encode("utf-8")
+
+
+def _write(name: str, data: bytes, overwrite: bool = False):
+    """Кладёт файл в хранилище. Версионированные файлы не перезаписываются."""
+    if default_storage.exists(name) and not overwrite:
+        return
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # Хранилище без локальных путей (S3 и т.п.): замены одной операцией нет
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(data))
+        return
+
+    # Временный файл в том же каталоге и os.replace: читатель видит либо
+    # старый файл, либо новый, а параллельные сборки не плодят manifest_xxx.json
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        # mkstemp создаёт файл с правами 0600, nginx его не прочитает
+        os.chmod(tmp_path, default_storage.file_permissions_mode or 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _delete_version(version: str):
+    path = f"{SNAPSHOT_DIR}/{version}"
+    try:
+        shutil.rmtree(default_storage.path(path), ignore_errors=True)
+        return
+    except NotImplementedError:
+        pass
+    for sub in ("", "topics/"):
+        try:
+            _, files = default_storage.listdir(path + "/" + sub)
+        except FileNotFoundError:
+            continue
+        for name in files:
+            default_storage.delete(f"{path}/{sub}{name}")
+
+
+def _modified_time(name: str) -> datetime | None:
+    try:
+        return default_storage.get_modified_time(name)
+    except (FileNotFoundError, NotImplementedError):
+        return None
+
+
+def _prune_versions(keep: list[str]):
+    """Удаляет версии, которых нет в манифесте.
+
+    История версий в манифесте теряется, когда процессы публикуют снимки
+    одновременно, поэтому смотрим на сами каталоги. Свежие не трогаем:
+    их может прямо сейчас заполнять сборка другого процесса.
+    """
+    min_age = getattr(settings, "CATALOGUE_SNAPSHOT_PRUNE_AGE", 600)
+    now = datetime.now(timezone.utc)
+    try:
+        versions, _ = default_storage.listdir(SNAPSHOT_DIR)
+    except FileNotFoundError:
+        return
+    for version in versions:
+        if version in keep:
+            continue
+        path = f"{SNAPSHOT_DIR}/{version}"
+        # У хранилищ без каталогов (S3) смотрим на первый записанный файл
+        modified = _modified_time(path) or _modified_time(f"{path}/topics.json")
+        if modified and (now - modified).total_seconds() >= min_age:
+            _delete_version(version)
+
+
+def build_snapshot() -> dict:
+    """Собирает снимок каталога, публикует его и возвращает новый манифест."""
+    # seq до чтения данных: изменения во время сборки клиент получит из /changes
+    seq = current_seq()
+    topics = [TopicSchema.from_orm(t).dict() for t in Topic.objects.order_by("id")]
+    tasks_by_topic = defaultdict(list)
+    for task in LabTask.objects.order_by("id"):
+        tasks_by_topic[task.topic_id].append(LabTaskSchema.from_orm(task).dict())
+
+    files = {"topics.json": _dump(topics)}
+    for topic in topics:
+        files[f"topics/{topic['id']}.json"] = _dump(tasks_by_topic[topic["id"]])
+
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode("utf-8"))
+        digest.update(files[name])
+    version = digest.hexdigest()[:16]
+
+    for name, data in files.items():
+        path = f"{SNAPSHOT_DIR}/{version}/{name}"
+        _write(path, data)
+        # mtime=0 - одинаковое содержимое даёт одинаковый .gz
+        _write(path + ".gz", gzip.compress(data, mtime=0))
+
+    previous = read_manifest()
+    keep = getattr(settings, "CATALOGUE_SNAPSHOT_KEEP", 3)
+    history = [version] + [
+        v for v in (previous or {}).get("history", []) if v != version
+    ]
+
+    manifest = {
+        "version": version,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "topics_url": default_storage.url(f"{SNAPSHOT_DIR}/{version}/topics.json"),
+        "topic_urls": {
+            topic["id"]: default_storage.url(
+                f"{SNAPSHOT_DIR}/{version}/topics/{topic['id']}.json"
+            )
+            for topic in topics
+        },
+        "history": history[:keep],
+        "seq": seq,
+    }
+    _write(MANIFEST_NAME, _dump(manifest), overwrite=True)
+
+    # Старые версии оставляем на случай клиентов с закэшированным манифестом
+    _prune_versions(history[:keep])
+    return manifest
+
+
+def read_manifest() -> dict | None:
+    """Возвращает текущий манифест или None, если снимок ещё не собран."""
+    try:
+        with default_storage.open(MANIFEST_NAME, "rb") as fh:
+            manifest = json.load(fh)
+    except FileNotFoundError:
+        return None
+    # Ключи JSON-объекта всегда строки
+    manifest["topic_urls"] = {int(k): v for k, v in manifest["topic_urls"].items()}
+    return manifest
+
+
+class SnapshotRebuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def mark_dirty(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Первое изменение в процессе (в том числе после fork):
+                # поток мастера в воркер не переходит
+                self._start()
+            self._dirty = True
+        self._wakeup.set()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = getattr(settings, "CATALOGUE_SNAPSHOT_DELAY", 2)
+        while True:
+            self._wakeup.wait()
+            # Изменения, пришедшие за время ожидания, попадут в ту же сборку
+            time.sleep(delay)
+            self._wakeup.clear()
+            self.rebuild_if_dirty()
+            # Соединение этого потока не держим открытым между сборками
+            connections.close_all()
+
+    def rebuild_if_dirty(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        try:
+            build_snapshot()
+        except Exception:
+            logger.exception("Failed to rebuild catalogue snapshot")
+            # Повторим при следующем изменении или при остановке процесса
+            with self._lock:
+                self._dirty = True
+
+
+snapshot_rebuilder = SnapshotRebuilder()
+atexit.register(snapshot_rebuilder.rebuild_if_dirty)
+
+
+def schedule_snapshot_rebuild():
+    """Помечает снимок устаревшим после коммита; сборка идёт в фоновом потоке."""
+    transaction.on_commit(snapshot_rebuilder.mark_dirty)
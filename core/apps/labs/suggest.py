@@ -0,0 +1,224 @@
+"""
+Подсказки для строки поиска по названиям заданий и тем.
+
+Индекс - два отсортированных списка ключей: названия целиком и их хвосты,
+начинающиеся со второго и следующих слов; поиск - bisect по префиксу. Строится при
+первом обращении в каждом процессе. Изменения в своём процессе приходят
+через сигналы моделей, изменения из других воркеров догоняет фоновый поток
+по журналу изменений (ChangeLogEntry) раз в SUGGEST_SYNC_INTERVAL секунд,
+так что запрос после первого к БД не обращается и не ждёт синхронизацию.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Topic, LabTask, ChangeLogEntry
+
+logger = logging.getLogger(__name__)
+
+TASK = "task"
+TOPIC = "topic"
+
+# Сколько слов названия индексировать как начало подсказки
+MAX_WORDS_PER_LABEL = 8
+# Сколько ключей каждого списка просматривать на один запрос
+MAX_SCAN = 200
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (ключ, позиция слова, тип, id), отсортированы. Начала названий
+        # отдельно, чтобы хвосты других названий не вытесняли их из MAX_SCAN
+        self._heads = []
+        self._tails = []
+        self._labels = {}  # (тип, id) -> (название, [ключи])
+        self._built = False
+        self._last_seq = 0
+        self._full_logged = False
+        self._thread = None
+        self._pid = None
+
+    def _entries(self, kind: str, obj_id: int, label: str, size: int) -> list:
+        max_entries = getattr(settings, "SUGGEST_MAX_ENTRIES", 100000)
+        words = normalize(label).split(" ")
+        entries = []
+        for pos in range(min(len(words), MAX_WORDS_PER_LABEL)):
+            if size + len(entries) >= max_entries:
+                # Память ограничена: при переполнении индексируем
+                # только начало названия, а затем перестаём добавлять
+                if not self._full_logged:
+                    logger.warning("Suggest index is full (%s keys)", max_entries)
+                    self._full_logged = True
+                break
+            entries.append((" ".join(words[pos:]), pos, kind, obj_id))
+        if entries:
+            self._labels[kind, obj_id] = (label, entries)
+        return entries
+
+    def _keys_for(self, entry: tuple) -> list:
+        return self._heads if entry[1] == 0 else self._tails
+
+    def _add(self, kind: str, obj_id: int, label: str):
+        size = len(self._heads) + len(self._tails)
+        for entry in self._entries(kind, obj_id, label, size):
+            bisect.insort(self._keys_for(entry), entry)
+
+    def _remove(self, kind: str, obj_id: int):
+        item = self._labels.pop((kind, obj_id), None)
+        if item is None:
+            return
+        for entry in item[1]:
+            keys = self._keys_for(entry)
+            i = bisect.bisect_left(keys, entry)
+            if i < len(keys) and keys[i] == entry:
+                del keys[i]
+
+    def _load(self, topics, tasks, seq: int):
+        """Заполняет индекс заново из пар (id, название)."""
+        self._labels = {}
+        keys = []
+        for topic_id, name in topics:
+            keys.extend(self._entries(TOPIC, topic_id, name, len(keys)))
+        for task_id, title in tasks:
+            keys.extend(self._entries(TASK, task_id, title, len(keys)))
+        # Одна сортировка вместо insort на каждый ключ
+        self._heads = sorted(entry for entry in keys if entry[1] == 0)
+        self._tails = sorted(entry for entry in keys if entry[1] > 0)
+        self._last_seq = seq
+        self._built = True
+
+    def _build(self):
+        # seq до чтения данных: изменения во время сборки применятся повторно
+        seq = (
+            ChangeLogEntry.objects.order_by("-id").values_list("id", flat=True).first()
+            or 0
+        )
+        self._load(
+            Topic.objects.values_list("id", "name").iterator(),
+            LabTask.objects.values_list("id", "title").iterator(),
+            seq,
+        )
+
+    def _fetch_changes(self, since: int):
+        """
+        Читает из журнала изменения после since. Возвращает новый seq и
+        {тип: {id: название или None}}; None - объект удалён.
+        """
+        entries = list(
+            ChangeLogEntry.objects.filter(id__gt=since).order_by("id")[:1000]
+        )
+        if not entries:
+            return since, {}
+        changed = {TOPIC: set(), TASK: set()}
+        for entry in entries:
+            kind = TOPIC if entry.model == "topic" else TASK
+            changed[kind].add(entry.object_id)
+        current = {
+            TOPIC: dict(
+                Topic.objects.filter(id__in=changed[TOPIC]).values_list("id", "name")
+            ),
+            TASK: dict(
+                LabTask.objects.filter(id__in=changed[TASK]).values_list("id", "title")
+            ),
+        }
+        changes = {
+            kind: {obj_id: current[kind].get(obj_id) for obj_id in ids}
+            for kind, ids in changed.items()
+        }
+        return entries[-1].id, changes
+
+    def _sync(self):
+        """Догоняет изменения из журнала, сделанные другими процессами."""
+        while True:
+            with self._lock:
+                since = self._last_seq
+            # Запросы к БД - без блокировки, чтобы не задерживать suggest()
+            seq, changes = self._fetch_changes(since)
+            if seq == since:
+                break
+            with self._lock:
+                for kind, labels in changes.items():
+                    for obj_id, label in labels.items():
+                        self._remove(kind, obj_id)
+                        if label is not None:
+                            self._add(kind, obj_id, label)
+                self._last_seq = seq
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, "SUGGEST_SYNC_INTERVAL", 5)
+        while True:
+            time.sleep(interval)
+            try:
+                self._sync()
+            except Exception:
+                logger.exception("Failed to sync suggest index")
+            # Соединение этого потока не держим открытым между синхронизациями
+            connections.close_all()
+
+    def _ensure_fresh(self):
+        if not self._built:
+            self._build()
+        if self._pid != os.getpid():
+            # Первый запрос в процессе (в том числе после fork):
+            # поток мастера в воркер не переходит
+            self._start()
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[dict]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_fresh()
+            candidates = {}
+            # Совпадение с началом названия важнее совпадения со словом,
+            # хвосты смотрим, только если начал не хватило на limit
+            for keys in (self._heads, self._tails):
+                if len(candidates) >= limit:
+                    break
+                start = bisect.bisect_left(keys, (prefix,))
+                for key, pos, kind, obj_id in keys[start : start + MAX_SCAN]:
+                    if not key.startswith(prefix):
+                        break
+                    if pos < candidates.get((kind, obj_id), MAX_WORDS_PER_LABEL):
+                        candidates[kind, obj_id] = pos
+            ranked = sorted(
+                candidates.items(),
+                key=lambda item: (item[1], self._labels[item[0]][0].casefold()),
+            )
+            return [
+                {"kind": kind, "id": obj_id, "label": self._labels[kind, obj_id][0]}
+                for (kind, obj_id), _ in ranked[:limit]
+            ]
+
+    def update(self, kind: str, obj_id: int, label: str | None):
+        """Обновление из сигнала; label=None - объект удалён."""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(kind, obj_id)
+            if label is not None:
+                self._add(kind, obj_id, label)
+
+
+suggest_index = PrefixIndex()
+
+
+def schedule_index_update(kind: str, obj_id: int, label: str | None):
+    # После коммита: откаченные изменения в индекс не попадают
+    transaction.on_commit(lambda: suggest_index.update(kind, obj_id, label))
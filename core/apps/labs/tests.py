@@ -1,3 +1,463 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.db import DatabaseError
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from ninja_jwt.tokens import RefreshToken
+
+from core.apps.users.models import User
+
+from .archives import ArchiveError, find_member, member_filename, stream_member
+from .changelog import current_seq
+from .counters import DOWNLOAD, VIEW, HitCounter
+from .models import ChangeLogEntry, LabTask, Topic
+from .schema import LAB_TASK_FIELDS, parse_task_fields
+from .snapshots import SnapshotRebuilder, build_snapshot, read_manifest
+from .suggest import TASK, TOPIC, PrefixIndex
+
+
+class ArchiveTests(SimpleTestCase):
+    files = {
+        "README.md": b"# Lab\n",
+        "src/main.py": b"print('hello')\n" * 5000,
+    }
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("src/", b"")
+            zf.writestr("README.md", self.files["README.md"], zipfile.ZIP_STORED)
+            zf.writestr("src/main.py", self.files["src/main.py"], zipfile.ZIP_DEFLATED)
+            zf.writestr("data.bin", b"\x00\x01" * 1000, zipfile.ZIP_BZIP2)
+        self.task = LabTask(title="Archive")
+        self.task.file.save("lab.zip", ContentFile(buffer.getvalue()), save=False)
+
+    def read(self, entry) -> bytes:
+        return b"".join(stream_member(self.task.file, entry))
+
+    def test_stored_and_deflated(self):
+        for name, data in self.files.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.read(find_member(self.task.file, name)), data)
+
+    def test_other_compression_falls_back_to_zipfile(self):
+        entry = find_member(self.task.file, "data.bin")
+        self.assertEqual(self.read(entry), b"\x00\x01" * 1000)
+
+    def test_directories_and_unknown_names(self):
+        self.assertIsNone(find_member(self.task.file, "src/"))
+        self.assertIsNone(find_member(self.task.file, "missing.txt"))
+
+    def test_crc_mismatch(self):
+        for name in self.files:
+            with self.subTest(name=name):
+                entry = dict(find_member(self.task.file, name))
+                entry["crc"] ^= 1
+                with self.assertRaises(ArchiveError):
+                    self.read(entry)
+
+
+class ArchiveMemberDownloadTests(TestCase):
+    names = ["Задание.md", 'docs/a"b.txt', "dir\\win.txt", "bad\nname.txt"]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for name in self.names:
+                zf.writestr(name, b"data")
+        topic = Topic.objects.create(name="Archives", description="")
+        self.task = LabTask(title="Archive", description="", topic=topic)
+        self.task.file.save("lab.zip", ContentFile(buffer.getvalue()))
+        self.user = User.objects.create_user(username="student", password="x")
+
+    def download(self, name: str):
+        token = RefreshToken.for_user(self.user).access_token
+        return self.client.get(
+            f"/api/labs/tasks/{self.task.id}/archive/member",
+            {"name": name},
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    def test_member_filename(self):
+        self.assertEqual(
+            [member_filename(name) for name in self.names],
+            ["Задание.md", 'a"b.txt', "win.txt", "badname.txt"],
+        )
+        self.assertEqual(member_filename("dir/\x01"), "file")
+
+    def test_content_disposition(self):
+        expected = {
+            "Задание.md": "attachment; filename*=utf-8''"
+            "%D0%97%D0%B0%D0%B4%D0%B0%D0%BD%D0%B8%D0%B5.md",
+            'docs/a"b.txt': 'attachment; filename="a\\"b.txt"',
+            "dir\\win.txt": 'attachment; filename="win.txt"',
+            "bad\nname.txt": 'attachment; filename="badname.txt"',
+        }
+        for name, header in expected.items():
+            with self.subTest(name=name):
+                response = self.download(name)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Disposition"], header)
+                self.assertEqual(b"".join(response.streaming_content), b"data")
+
+
+class ParseTaskFieldsTests(SimpleTestCase):
+    def test_all_fields_by_default(self):
+        self.assertEqual(parse_task_fields(None), list(LAB_TASK_FIELDS))
+        self.assertEqual(parse_task_fields(""), list(LAB_TASK_FIELDS))
+
+    def test_strips_and_deduplicates(self):
+        self.assertEqual(parse_task_fields(" title, id,title ,"), ["title", "id"])
+
+    def test_unknown_field(self):
+        with self.assertRaisesMessage(ValueError, "Unknown fields: secret"):
+            parse_task_fields("id,secret")
+
+    def test_no_fields(self):
+        for fields in (",", " , ,", " "):
+            with self.subTest(fields=fields):
+                with self.assertRaises(ValueError):
+                    parse_task_fields(fields)
+
+
+class TaskBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="student", password="x")
+        topic = Topic.objects.create(name="Graphs", description="")
+        cls.tasks = [
+            LabTask.objects.create(title=f"Task {i}", description="", topic=topic)
+            for i in range(3)
+        ]
+
+    def get(self, **params):
+        token = RefreshToken.for_user(self.user).access_token
+        return self.client.get(
+            "/api/labs/tasks", params, HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_order_and_missing(self):
+        first, _, third = self.tasks
+        missing_id = third.id + 100
+        response = self.get(
+            ids=f"{third.id},{missing_id},{first.id},{third.id}", fields="id,title"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "items": [
+                    {"id": third.id, "title": "Task 2"},
+                    {"id": first.id, "title": "Task 0"},
+                ],
+                "missing": [missing_id],
+            },
+        )
+
+    def test_bad_fields(self):
+        response = self.get(ids=str(self.tasks[0].id), fields=",")
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_ids(self):
+        response = self.get(ids="1,x")
+        self.assertEqual(response.status_code, 400)
+
+
+class ChangeLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="student", password="x")
+
+    def get(self, **params):
+        token = RefreshToken.for_user(self.user).access_token
+        return self.client.get(
+            "/api/labs/changes", params, HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_topic_delete_logs_cascaded_tasks(self):
+        topic = Topic.objects.create(name="Graphs", description="")
+        tasks = [
+            LabTask.objects.create(title=f"Task {i}", description="", topic=topic)
+            for i in range(2)
+        ]
+        since = current_seq()
+        topic_id = topic.id
+        topic.delete()
+        deleted = set(
+            ChangeLogEntry.objects.filter(id__gt=since).values_list(
+                "op", "model", "object_id"
+            )
+        )
+        self.assertEqual(
+            deleted,
+            {("delete", "labtask", task.id) for task in tasks}
+            | {("delete", "topic", topic_id)},
+        )
+
+    def test_since_past_head(self):
+        Topic.objects.create(name="Graphs", description="")
+        head = current_seq()
+        response = self.get(since=head + 100)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"changes": [], "next": head, "head": head})
+
+        response = self.get(since=head - 1)
+        self.assertEqual(response.json()["next"], head)
+        self.assertEqual(len(response.json()["changes"]), 1)
+
+
+class ChangeLogAutocommitTests(TransactionTestCase):
+    # Вне транзакции колбэк снимка каталога выполняется сразу
+    # и запустил бы фоновую сборку
+    @mock.patch("core.apps.labs.signals.schedule_snapshot_rebuild")
+    def test_warns_outside_atomic(self, schedule):
+        with self.assertLogs("core.apps.labs.changelog", "WARNING"):
+            topic = Topic.objects.create(name="Graphs", description="")
+        self.assertEqual(ChangeLogEntry.objects.get().object_id, topic.id)
+
+
+class SnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="student", password="x")
+        cls.topic = Topic.objects.create(name="Graphs", description="")
+        cls.task = LabTask.objects.create(title="BFS", description="", topic=cls.topic)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def read_json(self, name: str):
+        with open(os.path.join(self.media, "catalogue", name), "rb") as fh:
+            return json.load(fh)
+
+    def test_build_publishes_manifest(self):
+        self.assertIsNone(read_manifest())
+        manifest = build_snapshot()
+        self.assertEqual(read_manifest(), manifest)
+        version = manifest["version"]
+        self.assertEqual(
+            [t["name"] for t in self.read_json(f"{version}/topics.json")], ["Graphs"]
+        )
+        self.assertEqual(
+            [
+                t["title"]
+                for t in self.read_json(f"{version}/topics/{self.topic.id}.json")
+            ],
+            ["BFS"],
+        )
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.media, "catalogue", version, "topics.json.gz")
+            )
+        )
+
+        Topic.objects.create(name="Trees", description="")
+        manifest = build_snapshot()
+        self.assertNotEqual(manifest["version"], version)
+        self.assertEqual(manifest["history"], [manifest["version"], version])
+        self.assertEqual(read_manifest()["version"], manifest["version"])
+
+    def test_prune_orphaned_versions(self):
+        version = build_snapshot()["version"]
+        catalogue = os.path.join(self.media, "catalogue")
+        for orphan, age in (("0" * 16, 7200), ("1" * 16, 10)):
+            os.makedirs(os.path.join(catalogue, orphan))
+            mtime = time.time() - age
+            os.utime(os.path.join(catalogue, orphan), (mtime, mtime))
+        build_snapshot()
+        self.assertEqual(
+            sorted(os.listdir(catalogue)), ["1" * 16, version, "manifest.json"]
+        )
+
+    def test_one_rebuild_per_transaction(self):
+        rebuilder = SnapshotRebuilder()
+        # Без фонового потока: собираем вручную
+        rebuilder._pid = os.getpid()
+        with mock.patch("core.apps.labs.snapshots.snapshot_rebuilder", rebuilder):
+            with self.captureOnCommitCallbacks(execute=True):
+                for name in ("Trees", "Heaps", "Tries"):
+                    Topic.objects.create(name=name, description="")
+                self.assertFalse(rebuilder._dirty)
+        self.assertTrue(rebuilder._dirty)
+        with mock.patch("core.apps.labs.snapshots.build_snapshot") as build:
+            rebuilder.rebuild_if_dirty()
+            rebuilder.rebuild_if_dirty()
+        build.assert_called_once_with()
+
+    def test_catalogue_not_built(self):
+        token = RefreshToken.for_user(self.user).access_token
+        with mock.patch("core.apps.labs.api.snapshot_rebuilder") as rebuilder:
+            response = self.client.get(
+                "/api/labs/catalogue", HTTP_AUTHORIZATION=f"Bearer {token}"
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+        rebuilder.mark_dirty.assert_called_once_with()
+        self.assertIsNone(read_manifest())
+
+
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="student", password="x")
+        cls.admin = User.objects.create_user(
+            username="admin", password="x", is_admin=True
+        )
+
+    def get(self, user, **headers):
+        token = RefreshToken.for_user(user).access_token
+        with mock.patch("core.apps.labs.profiling.save_profile") as save:
+            response = self.client.get(
+                "/api/labs/topics", HTTP_AUTHORIZATION=f"Bearer {token}", **headers
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, save
+
+    def test_admin_header(self):
+        response, save = self.get(self.admin, HTTP_X_PROFILE="1")
+        save.assert_called_once()
+        profile = save.call_args.args[0]
+        self.assertEqual(response["X-Profile-Id"], profile["id"])
+        self.assertEqual(profile["path"], "/api/labs/topics")
+
+    def test_non_admin_header_ignored(self):
+        response, save = self.get(self.user, HTTP_X_PROFILE="1")
+        save.assert_not_called()
+        self.assertNotIn("X-Profile-Id", response.headers)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_request_gets_no_id(self):
+        response, save = self.get(self.user)
+        save.assert_called_once()
+        self.assertNotIn("X-Profile-Id", response.headers)
+
+
+class HitCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        topic = Topic.objects.create(name="Graphs", description="")
+        cls.task = LabTask.objects.create(title="BFS", description="", topic=topic)
+
+    def make_counter(self) -> HitCounter:
+        counter = HitCounter()
+        # Без фонового потока: сбрасываем вручную
+        counter._pid = os.getpid()
+        return counter
+
+    def test_flush(self):
+        counter = self.make_counter()
+        counter.hit(self.task.id, VIEW)
+        counter.hit(self.task.id, VIEW)
+        counter.hit(self.task.id, DOWNLOAD)
+        counter.flush()
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.view_count, self.task.download_count), (2, 1))
+        self.assertEqual(counter._pending, {})
+
+    def test_failed_flush_requeues_hits(self):
+        counter = self.make_counter()
+        counter.hit(self.task.id, VIEW)
+        counter.hit(self.task.id, VIEW)
+        counter.hit(self.task.id, DOWNLOAD)
+        with mock.patch.object(
+            LabTask.objects, "filter", side_effect=DatabaseError("down")
+        ):
+            with self.assertLogs("core.apps.labs.counters", "ERROR"):
+                counter.flush()
+        self.assertEqual(
+            counter._pending, {(VIEW, self.task.id): 2, (DOWNLOAD, self.task.id): 1}
+        )
+        self.assertEqual(counter._hits, 3)
+
+        counter.flush()
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.view_count, self.task.download_count), (2, 1))
+
+
+def make_index(topics=(), tasks=()) -> PrefixIndex:
+    index = PrefixIndex()
+    # Поток синхронизации с БД в тестах не нужен
+    index._pid = os.getpid()
+    index._load(topics, tasks, seq=0)
+    return index
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def test_title_start_ranked_before_word_match(self):
+        index = make_index(
+            topics=[(1, "Python basics")],
+            tasks=[(1, "Intro to Python"), (2, "python lab"), (3, "Java")],
+        )
+        labels = [s["label"] for s in index.suggest("pyth")]
+        self.assertEqual(labels, ["Python basics", "python lab", "Intro to Python"])
+
+    def test_title_start_not_crowded_out_by_word_matches(self):
+        # Хвостов с префиксом больше, чем просматривается за запрос
+        tasks = [(i, f"Lab {i:03} about graphs") for i in range(1, 301)]
+        tasks.append((1000, "Graphs"))
+        index = make_index(tasks=tasks)
+        result = index.suggest("graphs", limit=3)
+        self.assertEqual(result[0], {"kind": TASK, "id": 1000, "label": "Graphs"})
+        self.assertEqual(len(result), 3)
+
+    def test_topics_and_tasks_are_separate(self):
+        index = make_index(topics=[(1, "Sorting")], tasks=[(1, "Sorting")])
+        kinds = sorted(s["kind"] for s in index.suggest("sort"))
+        self.assertEqual(kinds, [TASK, TOPIC])
+
+    def test_update_and_removal(self):
+        index = make_index(tasks=[(1, "Linked lists"), (2, "Linear search")])
+        index.update(TASK, 1, "Hash tables")
+        index.update(TASK, 2, None)
+        self.assertEqual(index.suggest("lin"), [])
+        self.assertEqual(
+            index.suggest("hash"), [{"kind": TASK, "id": 1, "label": "Hash tables"}]
+        )
+        self.assertEqual(index._heads, [("hash tables", 0, TASK, 1)])
+        self.assertEqual(index._tails, [("tables", 1, TASK, 1)])
+
+    def test_update_before_build_is_ignored(self):
+        index = PrefixIndex()
+        index.update(TASK, 1, "Trees")
+        self.assertEqual(index._heads, [])
+
+    @override_settings(SUGGEST_MAX_ENTRIES=5)
+    def test_entries_cap(self):
+        with self.assertLogs("core.apps.labs.suggest", "WARNING"):
+            index = make_index(
+                tasks=[(1, "one two three"), (2, "four five six"), (3, "seven")]
+            )
+        self.assertEqual(len(index._heads) + len(index._tails), 5)
+        # Начало названия индексируется раньше хвостов
+        self.assertEqual(sorted(entry[3] for entry in index._heads), [1, 2])
+        self.assertEqual(index.suggest("seven"), [])
+        index.update(TASK, 4, "eight")
+        self.assertEqual(index.suggest("eight"), [])
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core.apps.users"
+
+    def ready(self):
+        from django.core import checks
+        from core.project.middleware import check_browser_middleware
+
+        checks.register(check_browser_middleware, checks.Tags.admin)
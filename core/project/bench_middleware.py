@@ -0,0 +1,122 @@
+"""
+Замер накладных расходов middleware на запрос к API.
+
+Сравнивает прежний общий список MIDDLEWARE с текущей конфигурацией
+(BrowserMiddleware) на пустом представлении, так что разница - это
+стоимость самих middleware. БД не используется.
+
+    python -m core.project.bench_middleware --requests 20000
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from django.http import JsonResponse
+from django.urls import path
+
+# Прежний список: все запросы проходили через всю цепочку
+FULL_MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "corsheaders.middleware.CorsMiddleware",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.apps.labs.profiling.ProfilingMiddleware",
+]
+
+
+def ping(request):
+    return JsonResponse({"ok": True})
+
+
+# URLconf для замера: request.urlconf указывает на этот модуль
+urlpatterns = [path("api/ping", ping), path("admin/ping", ping)]
+
+
+def build_handler(middleware: list[str]):
+    from django.core.handlers.base import BaseHandler
+    from django.test import override_settings
+
+    with override_settings(MIDDLEWARE=middleware):
+        handler = BaseHandler()
+        handler.load_middleware()
+    return handler
+
+
+def trimmed_mean(timings: list[float]) -> float:
+    """Среднее в микросекундах без 5% самых медленных (GC, планировщик)."""
+    timings = sorted(timings)
+    kept = timings[: max(1, int(len(timings) * 0.95))]
+    return sum(kept) / len(kept) * 1e6
+
+
+def measure(handlers: dict, url: str, requests: int) -> dict[str, float]:
+    """
+    Среднее время запроса для каждого обработчика. Обработчики чередуются
+    на каждом запросе, так что прогрев и фоновые помехи делятся поровну.
+    """
+    from django.test import RequestFactory
+
+    factory = RequestFactory(HTTP_HOST="localhost")
+    timings = {name: [] for name in handlers}
+    order = list(handlers)
+    for i in range(requests):
+        # Меняем очерёдность, чтобы ни один обработчик не шёл всегда первым
+        for name in order[i % len(order) :] + order[: i % len(order)]:
+            request = factory.get(url)
+            request.urlconf = __name__
+            start = time.perf_counter()
+            handlers[name].get_response(request)
+            timings[name].append(time.perf_counter() - start)
+    return {name: trimmed_mean(values) for name, values in timings.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Итоговое значение - медиана повторов"
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.project.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    handlers = {
+        "full": build_handler(FULL_MIDDLEWARE),
+        "lean": build_handler(settings.MIDDLEWARE),
+    }
+    urls = ("/api/ping", "/admin/ping")
+    for url in urls:
+        measure(handlers, url, 500)  # прогрев каждой пары URL x обработчик
+
+    runs = {(url, name): [] for url in urls for name in handlers}
+    per_repeat = max(1, args.requests // args.repeats)
+    for _ in range(args.repeats):
+        for url in urls:
+            for name, value in measure(handlers, url, per_repeat).items():
+                runs[url, name].append(value)
+
+    results = {key: statistics.median(values) for key, values in runs.items()}
+    for (url, name), value in results.items():
+        spread = max(runs[url, name]) - min(runs[url, name])
+        print(f"{url:12} {name:5} {value:8.1f} us/request (spread {spread:.1f})")
+
+    saved = results["/api/ping", "full"] - results["/api/ping", "lean"]
+    print(
+        f"API overhead saved: {saved:.1f} us/request "
+        f"({saved / results['/api/ping', 'full'] * 100:.0f}%), "
+        f"median of {args.repeats} repeats"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Middleware, которые нужны только браузерной части сайта (админке).
+
+Оба NinjaAPI работают с csrf=False и аутентифицируют по JWT, поэтому
+сессии, CSRF, django-аутентификация, сообщения и X-Frame-Options для путей
+из API_PATH_PREFIXES - лишняя работа на каждый запрос. BrowserMiddleware
+собирает цепочку из settings.BROWSER_MIDDLEWARE так же, как это делает
+обработчик Django для MIDDLEWARE, и пропускает через неё только запросы
+вне API.
+
+Проверки админки (admin.E408-E410) ищут сессии, аутентификацию и сообщения
+только в MIDDLEWARE, поэтому они отключены в SILENCED_SYSTEM_CHECKS, а
+check_browser_middleware проверяет то же самое с учётом BROWSER_MIDDLEWARE.
+"""
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+SESSION_MIDDLEWARE = "django.contrib.sessions.middleware.SessionMiddleware"
+AUTH_MIDDLEWARE = "django.contrib.auth.middleware.AuthenticationMiddleware"
+MESSAGE_MIDDLEWARE = "django.contrib.messages.middleware.MessageMiddleware"
+# Без них админка не работает: путь -> id ошибки
+ADMIN_MIDDLEWARE = {
+    SESSION_MIDDLEWARE: "project.E001",
+    AUTH_MIDDLEWARE: "project.E002",
+    MESSAGE_MIDDLEWARE: "project.E003",
+}
+
+
+class BrowserMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.api_prefixes = tuple(getattr(settings, "API_PATH_PREFIXES", ("/api/",)))
+
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        handler = get_response
+        # Тот же порядок хуков, что в BaseHandler.load_middleware
+        for middleware_path in reversed(settings.BROWSER_MIDDLEWARE):
+            mw_instance = import_string(middleware_path)(handler)
+            if hasattr(mw_instance, "process_view"):
+                self._view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, "process_template_response"):
+                self._template_response_middleware.append(
+                    mw_instance.process_template_response
+                )
+            if hasattr(mw_instance, "process_exception"):
+                self._exception_middleware.append(mw_instance.process_exception)
+            handler = convert_exception_to_response(mw_instance)
+        self.browser_handler = handler
+
+    def is_api(self, request) -> bool:
+        return request.path_info.startswith(self.api_prefixes)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for method in self._view_middleware:
+            response = method(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_api(request):
+            return response
+        for method in self._template_response_middleware:
+            response = method(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for method in self._exception_middleware:
+            response = method(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+def _index_of_subclass(middleware_path: str, middleware: list[str]) -> int | None:
+    # Как admin.checks._contains_subclass, но возвращает позицию
+    middleware_cls = import_string(middleware_path)
+    for i, path in enumerate(middleware):
+        try:
+            if issubclass(import_string(path), middleware_cls):
+                return i
+        except ImportError:
+            continue
+    return None
+
+
+def check_browser_middleware(app_configs, **kwargs):
+    """Замена admin.E408-E410: админке нужны сессии, аутентификация и сообщения."""
+    if not apps.is_installed("django.contrib.admin"):
+        return []
+    # Цепочка, через которую проходят запросы админки
+    middleware = list(settings.MIDDLEWARE)
+    browser = _index_of_subclass(
+        "core.project.middleware.BrowserMiddleware", middleware
+    )
+    if browser is not None:
+        middleware += list(getattr(settings, "BROWSER_MIDDLEWARE", []))
+
+    errors = []
+    positions = {}
+    for path, error_id in ADMIN_MIDDLEWARE.items():
+        positions[path] = _index_of_subclass(path, middleware)
+        if positions[path] is None:
+            errors.append(
+                checks.Error(
+                    f"'{path}' must be in MIDDLEWARE or, when "
+                    "BrowserMiddleware is used, in BROWSER_MIDDLEWARE in order "
+                    "to use the admin application.",
+                    id=error_id,
+                )
+            )
+    session, auth = positions[SESSION_MIDDLEWARE], positions[AUTH_MIDDLEWARE]
+    if session is not None and auth is not None and session > auth:
+        errors.append(
+            checks.Error(
+                f"'{SESSION_MIDDLEWARE}' must come before '{AUTH_MIDDLEWARE}'.",
+                id="project.E004",
+            )
+        )
+    return errors
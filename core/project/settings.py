@@ -26,7 +26,10 @@ environ.Env.read_env(BASE_DIR / ".env")
 SECRET_KEY: str = env("DJANGO_SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Выключен по умолчанию для любого способа запуска (WSGI, ASGI, manage.py):
+# с DEBUG=True Django хранит в памяти каждый выполненный SQL-запрос.
+# Для разработки - DJANGO_DEBUG=True в .env
+DEBUG = env.bool("DJANGO_DEBUG", default=False)
 
 ALLOWED_HOSTS = env("ALLOWED_HOSTS", default="localhost,127.0.0.1").split(",")
 
@@ -53,13 +56,26 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "core.project.middleware.BrowserMiddleware",
+    "core.apps.labs.profiling.ProfilingMiddleware",
+]
+
+# Выполняются только для путей вне API_PATH_PREFIXES (админка).
+# API работает по JWT с csrf=False, сессии и CSRF ему не нужны.
+BROWSER_MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
+API_PATH_PREFIXES = ["/api/"]
+
+# Проверки админки ищут эти middleware только в MIDDLEWARE, а они подключены
+# через BrowserMiddleware. Вместо них работает проверка
+# core.project.middleware.check_browser_middleware (project.E001-E004)
+SILENCED_SYSTEM_CHECKS = ["admin.E408", "admin.E409", "admin.E410"]
 
 ROOT_URLCONF = "core.project.urls"
 
@@ -93,6 +109,8 @@ DATABASES = {
         "PASSWORD": env("POSTGRES_PASSWORD"),
         "HOST": env("POSTGRES_HOST"),
         "PORT": env("POSTGRES_PORT"),
+        # Постоянные соединения в воркерах production-сервера (секунды)
+        "CONN_MAX_AGE": env.int("CONN_MAX_AGE", default=0),
     }
 }
 
@@ -157,6 +175,33 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Сколько версий статического снимка каталога хранить в media/catalogue/
+CATALOGUE_SNAPSHOT_KEEP = 3
+# Через сколько секунд после изменения фоновый поток пересобирает снимок
+CATALOGUE_SNAPSHOT_DELAY = 2
+# Версии не из манифеста удаляются, когда станут старше (секунды)
+CATALOGUE_SNAPSHOT_PRUNE_AGE = 600
+
+# Server-Sent Events ленты изменений /api/labs/changes/stream (секунды)
+CHANGES_POLL_INTERVAL = 1.0
+CHANGES_KEEPALIVE = 15.0
+CHANGES_STREAM_MAX_AGE = 300.0  # потом клиент переподключается с Last-Event-ID
+
+# Счётчики просмотров/скачиваний копятся в памяти и пишутся пачками
+COUNTERS_FLUSH_INTERVAL = 10  # секунды
+COUNTERS_FLUSH_THRESHOLD = 500  # хитов до внеочередного сброса
+
+# Индекс подсказок /api/labs/suggest: лимит ключей в памяти процесса
+# и период догоняющей синхронизации с журналом изменений (секунды)
+SUGGEST_MAX_ENTRIES = 100000
+SUGGEST_SYNC_INTERVAL = 5
+
+# Профилирование запросов: админ с заголовком X-Profile: 1 или случайная выборка
+PROFILING_SAMPLE_RATE = env.float("PROFILING_SAMPLE_RATE", default=0.0)
+PROFILING_INTERVAL = 0.005  # период снятия стека, секунды
+PROFILING_DIR = BASE_DIR / "profiles"
+PROFILING_KEEP = 200
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
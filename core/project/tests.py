@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from .middleware import check_browser_middleware
+
+
+class BrowserMiddlewareTests(SimpleTestCase):
+    def test_api_skips_browser_middleware(self):
+        response = self.client.get("/api/labs/catalogue")
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+        self.assertFalse(hasattr(response.wsgi_request, "user"))
+        self.assertNotIn("csrftoken", response.cookies)
+        self.assertNotIn("X-Frame-Options", response.headers)
+
+    def test_admin_keeps_browser_middleware(self):
+        response = self.client.get("/admin/login/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("csrftoken", response.cookies)
+        self.assertEqual(response.headers["X-Frame-Options"], "DENY")
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+        self.assertTrue(response.wsgi_request.user.is_anonymous)
+
+
+class CheckBrowserMiddlewareTests(SimpleTestCase):
+    def ids(self) -> list[str]:
+        return [error.id for error in check_browser_middleware(None)]
+
+    def test_current_settings(self):
+        self.assertEqual(self.ids(), [])
+
+    def test_missing_middleware(self):
+        browser = [m for m in settings.BROWSER_MIDDLEWARE if "sessions" not in m]
+        with override_settings(BROWSER_MIDDLEWARE=browser):
+            self.assertEqual(self.ids(), ["project.E001"])
+
+    def test_session_after_auth(self):
+        browser = list(reversed(settings.BROWSER_MIDDLEWARE))
+        with override_settings(BROWSER_MIDDLEWARE=browser):
+            self.assertEqual(self.ids(), ["project.E004"])
+
+    def test_browser_middleware_not_installed(self):
+        middleware = [m for m in settings.MIDDLEWARE if "Browser" not in m]
+        with override_settings(MIDDLEWARE=middleware):
+            self.assertEqual(
+                self.ids(), ["project.E001", "project.E002", "project.E003"]
+            )